@@ -4,33 +4,85 @@
 #
 # See LICENSE file for copyright and license details
 
-import copy, operator, random
+import random
+import sys
 
 # All alignments and sizes are currently specified in bits
 
+# Alignments are always powers of two, so rounding up can be done with a mask
 def align_to(x, align):
-    return x - (x % -align)
+    return (x + align - 1) & -align
+
+# Number of padding bits needed to bring offset up to the given alignment
+def pad_needed(offset, align):
+    return (-offset) & (align - 1)
+
+def check_pow2_size(size):
+    if size <= 0 or size & (size - 1):
+        raise ValueError('size must be a power of two')
+
+# Every type class has a KIND tag, so the calling convention logic can
+# dispatch on a small integer rather than on the class
+K_INT, K_FP, K_PTR, K_PAD, K_STRUCT, K_UNION, K_ARRAY, K_SLICE = range(8)
+
+# Scalar types are interned, so e.g. Int(8) is Int8. Code that needs a
+# distinct object to name or modify (such as RVMachine.call) must _clone one.
+
+# Unpickling an interned scalar gives back the interned instance, while a
+# clone is unpickled as a fresh clone so it stays distinct
+def _unpickle_clone(ty):
+    return ty._clone()
 
 class Int(object):
+    __slots__ = ('size', 'alignment', 'signed', '_ctype')
+    KIND = K_INT
+    _cache = {}
+    def __new__(cls, size, signed=True):
+        ty = cls._cache.get((size, signed))
+        if ty is None:
+            check_pow2_size(size)
+            ty = cls._cache[(size, signed)] = object.__new__(cls)
+            ty._ctype = None
+        return ty
+    # Copies are private objects that may be modified
+    def __reduce__(self):
+        args = (self.size, self.signed)
+        if self._cache.get(args) is self:
+            return (Int, args)
+        return (_unpickle_clone, (Int(*args),))
+    def __copy__(self):
+        return self._clone()
+    def __deepcopy__(self, memo):
+        return self._clone()
     def __init__(self, size, signed=True):
         self.size = size
         self.alignment = size
         self.signed = signed
+    def _clone(self):
+        new = object.__new__(type(self))
+        new.size = self.size
+        new.alignment = self.alignment
+        new.signed = self.signed
+        new._ctype = self._ctype
+        return new
+    def key(self):
+        return (K_INT, self.size, self.signed)
     def __repr__(self):
         return '{}Int{}'.format('S' if self.signed else 'U', self.size)
     def ctype(self):
-        ty = 'int'+str(self.size)+'_t'
-        if not self.signed:
-            return 'u'+ty
-        else:
-            return ty
-    def random_literal(self):
+        if self._ctype is None:
+            ty = 'int'+str(self.size)+'_t'
+            if not self.signed:
+                ty = 'u'+ty
+            self._ctype = ty
+        return self._ctype
+    def random_literal(self, rng=random):
         if self.signed:
             lower = -2**(self.size-1)
             upper = (2**(self.size-1))-1
-            val = random.randint(lower, upper)
+            val = rng.randint(lower, upper)
         else:
-            val = random.randint(0, 2**(self.size-1))
+            val = rng.randint(0, 2**(self.size-1))
         suffix = ''
         if not self.signed:
             suffix += 'u'
@@ -46,30 +98,61 @@ def UInt(size):
 def SInt(size):
     return Int(size, signed=True)
 
+# The named scalar types below are the interned instances, so they may be
+# compared with 'is' (e.g. Int(8) is Int8, UInt(8) is Char). Arguments seen by
+# CCState are clones and must be classified by KIND instead.
 Int8, Int16, Int32, Int64, Int128 = [SInt(i) for i in [8,16,32,64,128]]
 SInt8, SInt16, SInt32, SInt64, SInt128 = [Int8, Int16, Int32, Int64, Int128]
 UInt8, UInt16, UInt32, UInt64, UInt128 = [UInt(i) for i in [8,16,32,64,128]]
 Char = UInt8
 
 class FP(object):
+    __slots__ = ('size', 'alignment', '_ctype')
+    KIND = K_FP
+    _cache = {}
+    def __new__(cls, size):
+        ty = cls._cache.get(size)
+        if ty is None:
+            check_pow2_size(size)
+            ty = cls._cache[size] = object.__new__(cls)
+            ty._ctype = None
+        return ty
+    def __reduce__(self):
+        if self._cache.get(self.size) is self:
+            return (FP, (self.size,))
+        return (_unpickle_clone, (FP(self.size),))
+    def __copy__(self):
+        return self._clone()
+    def __deepcopy__(self, memo):
+        return self._clone()
     def __init__(self, size):
         self.size = size
         self.alignment = size
+    def _clone(self):
+        new = object.__new__(type(self))
+        new.size = self.size
+        new.alignment = self.alignment
+        new._ctype = self._ctype
+        return new
+    def key(self):
+        return (K_FP, self.size)
     def __repr__(self):
         return 'FP{}'.format(self.size)
     def ctype(self):
-        if self.size == 32:
-            return 'float'
-        elif self.size == 64:
-            return 'double'
-        elif self.size == 128:
-            return 'long double'
-        else:
-            raise ValueError('no ctype')
-    def random_literal(self):
+        if self._ctype is None:
+            if self.size == 32:
+                self._ctype = 'float'
+            elif self.size == 64:
+                self._ctype = 'double'
+            elif self.size == 128:
+                self._ctype = 'long double'
+            else:
+                raise ValueError('no ctype')
+        return self._ctype
+    def random_literal(self, rng=random):
         # For now, don't bother generating any possible fp value
-        int_part = random.randint(-1000, 1000)
-        fract_part = random.randint(0, 9)
+        int_part = rng.randint(-1000, 1000)
+        fract_part = rng.randint(0, 9)
         if self.size == 32:
             suffix = 'f'
         elif self.size == 64:
@@ -84,15 +167,39 @@ Float, Double, LongDouble = FP(32), FP(64), FP(128)
 FP32, FP64, FP128 = Float, Double, LongDouble
 
 class Ptr(object):
+    __slots__ = ('size', 'alignment')
+    KIND = K_PTR
+    _cache = {}
+    def __new__(cls, size):
+        ty = cls._cache.get(size)
+        if ty is None:
+            check_pow2_size(size)
+            ty = cls._cache[size] = object.__new__(cls)
+        return ty
+    def __reduce__(self):
+        if self._cache.get(self.size) is self:
+            return (Ptr, (self.size,))
+        return (_unpickle_clone, (Ptr(self.size),))
+    def __copy__(self):
+        return self._clone()
+    def __deepcopy__(self, memo):
+        return self._clone()
     def __init__(self, size):
         self.size = size
         self.alignment = size
+    def _clone(self):
+        new = object.__new__(type(self))
+        new.size = self.size
+        new.alignment = self.alignment
+        return new
+    def key(self):
+        return (K_PTR, self.size)
     def __repr__(self):
         return 'Ptr{}'.format(self.size)
     def ctype(self):
         return 'char*'
-    def random_literal(self):
-        val = random.randint(0, 2**(self.size-1))
+    def random_literal(self, rng=random):
+        val = rng.randint(0, 2**(self.size-1))
         suffix = 'u'
         if self.size == 64:
             suffix += 'll'
@@ -101,9 +208,28 @@ class Ptr(object):
 Ptr32, Ptr64 = Ptr(32), Ptr(64)
 
 class Pad(object):
+    __slots__ = ('size', 'alignment')
+    KIND = K_PAD
+    # Padding has no identity of its own (it is never named or assigned to a
+    # register), so a single instance is shared for each size
+    _cache = {}
+    def __new__(cls, size):
+        pad = cls._cache.get(size)
+        if pad is None:
+            pad = cls._cache[size] = object.__new__(cls)
+        return pad
+    def __getnewargs__(self):
+        return (self.size,)
     def __init__(self, size):
         self.size = size
         self.alignment = 1
+    def _clone(self):
+        new = object.__new__(type(self))
+        new.size = self.size
+        new.alignment = self.alignment
+        return new
+    def key(self):
+        return (K_PAD, self.size)
     def __repr__(self):
         return 'Pad{}'.format(self.size)
 
@@ -111,47 +237,98 @@ field_names = ['fld'+str(i) for i in range(0, 100)]
 struct_counter = 0
 
 class Struct(object):
+    __slots__ = ('members', 'name', 'size', 'alignment', '_flat',
+                 '_flat_layout', '_repr', '_key')
+    KIND = K_STRUCT
+
     # Add padding objects when necessary to ensure struct members have their 
-    # desired alignment
+    # desired alignment. The struct's size and alignment are computed in the
+    # same pass.
     def add_padding(self):
-        i = 0
+        out = []
         cur_offset = 0
-        while i < len(self.members):
-            wanted_align = self.members[i].alignment
-            if (cur_offset % wanted_align) != 0:
-                pad_size = -(cur_offset % -wanted_align)
-                self.members.insert(i, Pad(pad_size))
-                i += 1
+        alignment = 1
+        for m in self.members:
+            wanted_align = m.alignment
+            if wanted_align > alignment:
+                alignment = wanted_align
+            pad_size = pad_needed(cur_offset, wanted_align)
+            if pad_size:
+                out.append(Pad(pad_size))
                 cur_offset += pad_size
-            cur_offset += self.members[i].size
-            i+= 1
+            out.append(m)
+            cur_offset += m.size
+        self.members = tuple(out)
+        self.alignment = alignment
+        self.size = align_to(cur_offset, alignment)
 
+    # members is stored as a tuple, as it is not modified after construction
     def __init__(self, *members):
         global struct_counter
-        self.members = list(members)
+        self.members = members
+        self._flat = None
+        self._flat_layout = None
+        self._repr = None
+        self._key = None
+        self.name = 'strctty'+str(struct_counter)
+        struct_counter += 1
         if len(members) == 0:
             self.alignment = 8
             self.size = 0
             return
         self.add_padding()
-        self.alignment = max(m.alignment for m in members)
-        self.size = sum(m.size for m in members)
-        self.size = align_to(self.size, self.alignment)
-        self.name = 'strctty'+str(struct_counter)
-        struct_counter += 1
 
+    def _clone(self):
+        new = object.__new__(type(self))
+        new.members = self.members
+        new.name = self.name
+        new.size = self.size
+        new.alignment = self.alignment
+        new._flat = self._flat
+        new._flat_layout = self._flat_layout
+        new._repr = self._repr
+        new._key = self._key
+        return new
+
+    # A hashable description of the type's layout. Structurally identical
+    # types have equal keys, regardless of object identity or struct name.
+    def key(self):
+        if self._key is None:
+            self._key = (K_STRUCT, tuple(m.key() for m in self.members))
+        return self._key
+
+    # The flattened member list is computed on first use and then cached as
+    # a tuple. Members are only modified by add_padding during construction.
     def flatten(self):
-        children = []
-        for ty in self.members:
-            if hasattr(ty, 'flatten'):
-                children += ty.flatten()
-            else:
-                children.append(ty)
-        return children
-
+        if self._flat is None:
+            children = []
+            for ty in self.members:
+                flatten = getattr(ty, 'flatten', None)
+                if flatten is None:
+                    children.append(ty)
+                else:
+                    children.extend(flatten())
+            self._flat = tuple(children)
+        return self._flat
+
+    # The floating point calling convention inspects a struct as if it had
+    # been flattened. Return the size of the flattened struct and its
+    # non-padding members, computing them on first use.
+    def flat_layout(self):
+        if self._flat_layout is None:
+            flat_ty = Struct(*self.flatten())
+            mems = tuple(mem for mem in flat_ty.members
+                         if mem.KIND != K_PAD)
+            self._flat_layout = (flat_ty.size, mems)
+        return self._flat_layout
+
+    # Aggregates are not modified after construction, so their (potentially
+    # deeply nested) repr is computed once and cached
     def __repr__(self):
-        return 'Struct({}, s{}, a{})'.format(self.members, 
-                self.size, self.alignment)
+        if self._repr is None:
+            self._repr = 'Struct({}, s{}, a{})'.format(list(self.members),
+                    self.size, self.alignment)
+        return self._repr
 
     def cdecl(self):
         res = 'struct ' + self.name + ' { '
@@ -160,7 +337,7 @@ class Struct(object):
         for ty in self.members:
             if hasattr(ty, 'flatten'):
                 raise ValueError("don't support nested aggregates")
-            if isinstance(ty, Pad):
+            if ty.KIND == K_PAD:
                 continue
             mem_ctypes.append(ty.ctype() + ' ' + field_names[i] + ';')
             i += 1
@@ -169,118 +346,222 @@ class Struct(object):
     def ctype(self):
         return 'struct ' + self.name
 
-    def random_literal(self):
+    def random_literal(self, rng=random):
         res = '(struct ' + self.name + '){'
         random_lits = []
         for ty in self.members:
             if hasattr(ty, 'flatten'):
                 raise ValueError("don't support nested aggregates")
-            if isinstance(ty, Pad):
+            if ty.KIND == K_PAD:
                 continue
-            random_lits.append(ty.random_literal())
+            random_lits.append(ty.random_literal(rng))
         return res + ', '.join(random_lits) + '}'
 
 class Union(object):
+    __slots__ = ('members', 'size', 'alignment', '_repr')
+    KIND = K_UNION
     def __init__(self, *members):
-        self.members = list(members)
+        self.members = members
+        self._repr = None
         self.alignment = max(m.alignment for m in members)
         self.size = max(m.size for m in members)
         self.size = align_to(self.size, self.alignment)
+    def _clone(self):
+        new = object.__new__(type(self))
+        new.members = self.members
+        new.size = self.size
+        new.alignment = self.alignment
+        new._repr = self._repr
+        return new
+    def key(self):
+        return (K_UNION, tuple(m.key() for m in self.members))
     def __repr__(self):
-        return 'Union({}, s{}, a{})'.format(self.members, 
-                self.size, self.alignment)
+        if self._repr is None:
+            self._repr = 'Union({}, s{}, a{})'.format(list(self.members),
+                    self.size, self.alignment)
+        return self._repr
 
 class Array(object):
+    __slots__ = ('ty', 'num_elements', 'size', 'alignment', '_flat', '_repr',
+                 '_key')
+    KIND = K_ARRAY
     def __init__(self, ty, num_elements):
         self.ty = ty
         self.num_elements = num_elements
+        self._flat = None
+        self._repr = None
+        self._key = None
         self.alignment = ty.alignment
         self.size = ty.size * num_elements
 
+    def _clone(self):
+        new = object.__new__(type(self))
+        new.ty = self.ty
+        new.num_elements = self.num_elements
+        new.size = self.size
+        new.alignment = self.alignment
+        new._flat = self._flat
+        new._repr = self._repr
+        new._key = self._key
+        return new
+
+    def key(self):
+        if self._key is None:
+            self._key = (K_ARRAY, self.num_elements, self.ty.key())
+        return self._key
+
     def flatten(self):
-        if hasattr(self.ty, 'flatten'):
-            return self.ty.flatten() * self.num_elements
-        else:
-            return [self.ty] * self.num_elements
+        if self._flat is None:
+            flatten = getattr(self.ty, 'flatten', None)
+            if flatten is None:
+                self._flat = (self.ty,) * self.num_elements
+            else:
+                # Flatten the element type once and replicate the result
+                self._flat = flatten() * self.num_elements
+        return self._flat
 
     def __repr__(self):
-        return 'Array({}*{}, s{}, a{})'.format(self.ty, 
-                self.num_elements, self.size, self.alignment)
+        if self._repr is None:
+            self._repr = 'Array({}*{}, s{}, a{})'.format(self.ty,
+                    self.num_elements, self.size, self.alignment)
+        return self._repr
 
 class Slice(object):
+    __slots__ = ('child', 'low', 'high', 'size', 'alignment')
+    KIND = K_SLICE
     def __init__(self, child, low, high):
         self.child = child
         self.low = low
         self.high = high
         self.size = high - low + 1
         self.alignment = self.size
+    def _clone(self):
+        new = object.__new__(type(self))
+        new.child = self.child
+        new.low = self.low
+        new.high = self.high
+        new.size = self.size
+        new.alignment = self.alignment
+        return new
+    def key(self):
+        return (K_SLICE, self.child.key(), self.low, self.high)
     def __repr__(self):
         return '{}[{}:{}]'.format(self.child, self.low, self.high)
 
 class VarArgs(object):
+    __slots__ = ('args',)
     def __init__(self, *args):
-        self.args = list(args)
+        self.args = args
+    def _clone(self):
+        new = object.__new__(type(self))
+        new.args = self.args
+        return new
     def __repr__(self):
-        return 'VarArgs({})'.format(self.args)
+        return 'VarArgs({})'.format(list(self.args))
+
+# Kinds of flattened struct member pairs that may be passed according to the
+# floating point calling convention
+FP_PAIR_KINDS = frozenset([(K_FP, K_FP), (K_FP, K_INT), (K_INT, K_FP)])
+
+# Names for the first arguments and varargs of a call, built and interned
+# once rather than formatted for every call
+NUM_PREBUILT_NAMES = 16
+ARG_NAMES = tuple(sys.intern('arg'+str(i).zfill(2))
+                  for i in range(NUM_PREBUILT_NAMES))
+VARG_NAMES = tuple(sys.intern('varg'+str(i).zfill(2))
+                   for i in range(NUM_PREBUILT_NAMES))
+
+def arg_name(prebuilt, prefix, index):
+    if index < NUM_PREBUILT_NAMES:
+        return prebuilt[index]
+    return prefix+str(index).zfill(2)
 
 class CCState(object):
+    __slots__ = ('xlen', 'flen', 'gprs_left', 'gprs', 'fprs', 'fprs_left',
+                 'stack', '_stack_offsets', '_stack_end', '_names',
+                 '_named', 'refs',
+                 'in_args', 'var_args_index', 'out_arg', 'gpr_strs',
+                 'fpr_strs', 'stack_strs')
+
     def __init__(self, xlen, flen, in_args, var_args_index, out_arg):
         self.xlen = xlen
         self.flen = flen
+        # Only the argument registers are tracked, so gprs[0] is a0 (x10) and
+        # fprs[0] is fa0 (f10)
         self.gprs_left = 8
-        self.gprs = [None] * 32
+        self.gprs = [None] * 8
         self.fprs = None
         self.fprs_left = None
         if flen:
-            self.fprs = [None] * 32
+            self.fprs = [None] * 8
             self.fprs_left = 8
         self.stack = []
-        self.type_name_mapping = {}
+        # oldsp-relative offset (in bytes) of each stack object, and the end
+        # of the last object (in bits), maintained by assign_to_stack
+        self._stack_offsets = []
+        self._stack_end = 0
+        # Names keyed by the named object itself. The type classes don't
+        # define __eq__ or __hash__, so lookups are by identity, and they
+        # still work on a copied or unpickled state. _named records the
+        # named objects in the order they are listed by __repr__
+        self._names = {}
+        self._named = []
+        # (pointer, type) pairs for every object passed by reference
+        self.refs = []
         self.in_args = in_args
         self.var_args_index = var_args_index
         self.out_arg = out_arg
+        # Rendered names of the register and stack contents, filled in by
+        # update_strs() once assignment is complete
+        self.gpr_strs = None
+        self.fpr_strs = None
+        self.stack_strs = None
         self.name_types(in_args, var_args_index, out_arg)
 
     def name_types(self, in_args, var_args_index, out_arg):
-        i = 0
-        arg_idx = 0
-        varg_idx = 0
-        for index, ty in enumerate(in_args):
-            if index >= var_args_index:
-                self.type_name_mapping[ty] = 'varg'+str(varg_idx).zfill(2)
-                varg_idx += 1
-            else:
-                self.type_name_mapping[ty] = 'arg'+str(arg_idx).zfill(2)
-                arg_idx += 1
+        for index, ty in enumerate(in_args[:var_args_index]):
+            self.set_name(ty, arg_name(ARG_NAMES, 'arg', index))
         if out_arg:
-            self.type_name_mapping[out_arg] = 'ret'
+            self.set_name(out_arg, 'ret')
+        for index, ty in enumerate(in_args[var_args_index:]):
+            self.set_name(ty, arg_name(VARG_NAMES, 'varg', index))
+
+    def set_name(self, ty, name):
+        if ty not in self._names:
+            self._named.append(ty)
+        self._names[ty] = name
 
     def next_arg_gpr(self):
-        return (8-self.gprs_left)+10
+        return 8-self.gprs_left
 
     def skip_gpr(self):
         if (self.gprs_left == 0):
             raise ValueError('all GPRs assigned')
         self.gprs_left -= 1
 
+    # Shared by assign_to_gpr and assign_to_gpr_or_stack, so both apply the
+    # same checks
+    def _fill_gpr(self, ty):
+        if ty.size > self.xlen:
+            raise ValueError('object is larger than xlen')
+        if self.gprs_left <= 0:
+            raise ValueError('all argument registers already assigned')
+        self.gprs[self.next_arg_gpr()] = ty
+        self.gprs_left -= 1
+
     def assign_to_gpr_or_stack(self, ty):
         if ty.size > self.xlen:
             raise ValueError('object is larger than xlen')
         if self.gprs_left >= 1:
-            self.assign_to_gpr(ty)
+            self._fill_gpr(ty)
         else:
             self.assign_to_stack(ty)
 
     def assign_to_gpr(self, ty):
-        if ty.size > self.xlen:
-            raise ValueError('object is larger than xlen')
-        if self.gprs_left <= 0:
-            raise ValueError('all argument registers already assigned')
-        self.gprs[self.next_arg_gpr()] = ty
-        self.gprs_left -= 1
+        self._fill_gpr(ty)
 
     def next_arg_fpr(self):
-        return (8-self.fprs_left)+10
+        return 8-self.fprs_left
 
     def assign_to_fpr(self, ty):
         if ty.size > self.flen:
@@ -290,107 +571,220 @@ class CCState(object):
         self.fprs[self.next_arg_fpr()] = ty
         self.fprs_left -= 1
 
+    # Assign to the next argument register of the given kind (K_INT or K_FP)
+    def assign_to_reg(self, kind, ty):
+        if kind == K_FP:
+            self.assign_to_fpr(ty)
+        else:
+            self.assign_to_gpr(ty)
+
     def assign_to_stack(self, ty):
         if ty.size > 2*self.xlen:
             raise ValueError('objects larger than 2x xlen should be passed by reference')
+        # Each object is aligned to at least xlen
+        offset = align_to(self._stack_end, max(self.xlen, ty.alignment))
         self.stack.append(ty)
+        self._stack_offsets.append(offset//8)
+        self._stack_end = offset + ty.size
+
+    def make_reference(self, ty):
+        # Each pointer is named after the object it refers to, so it must be
+        # a distinct object
+        ptrty = Ptr(self.xlen)._clone()
+        self.refs.append((ptrty, ty))
+        name = self._names.get(ty)
+        if name is not None:
+            self.set_name(ptrty, '&'+name)
+        return ptrty
 
     def pass_by_reference(self, ty):
-        ptrty = Ptr(self.xlen)
-        self.assign_to_gpr_or_stack(ptrty)
-        if ty in self.type_name_mapping:
-            self.type_name_mapping[ptrty] = '&'+self.type_name_mapping[ty]
+        self.assign_to_gpr_or_stack(self.make_reference(ty))
+
+    # Describe the register and stack assignments in terms of argument
+    # indices (-1 for the return type) rather than objects. The result can
+    # be applied with import_assignments to the state for any structurally
+    # identical signature.
+    def export_assignments(self):
+        index = {id(ty): idx for idx, ty in enumerate(self.in_args)}
+        if self.out_arg is not None:
+            index[id(self.out_arg)] = -1
+        refs = {id(ptrty): index[id(ty)] for ptrty, ty in self.refs}
+        def encode(obj):
+            if obj is None:
+                return None
+            # Checked first, as an argument may itself be a Slice
+            elif id(obj) in index:
+                return (index[id(obj)],)
+            elif obj.KIND == K_SLICE:
+                return (index[id(obj.child)], obj.low, obj.high)
+            return ('&', refs[id(obj)])
+        fprs = None
+        if self.fprs is not None:
+            fprs = tuple(map(encode, self.fprs))
+        return (tuple(map(encode, self.gprs)), fprs,
+                tuple(map(encode, self.stack)), tuple(self._stack_offsets),
+                self._stack_end, self.gprs_left, self.fprs_left)
+
+    def import_assignments(self, assignments):
+        (gprs, fprs, stack, stack_offsets, self._stack_end, self.gprs_left,
+         self.fprs_left) = assignments
+        def decode(entry):
+            if entry is None:
+                return None
+            elif entry[0] == '&':
+                return self.make_reference(self.arg_by_index(entry[1]))
+            ty = self.arg_by_index(entry[0])
+            if len(entry) == 1:
+                return ty
+            return Slice(ty, entry[1], entry[2])
+        self.gprs = [decode(entry) for entry in gprs]
+        if fprs is not None:
+            self.fprs = [decode(entry) for entry in fprs]
+        self.stack = [decode(entry) for entry in stack]
+        self._stack_offsets = list(stack_offsets)
+
+    def arg_by_index(self, idx):
+        return self.out_arg if idx == -1 else self.in_args[idx]
 
     def typestr_or_name(self, ty):
-        suffix = ''
-        if ty == None:
+        if ty is None:
             return '?'
-        elif isinstance(ty, Slice):
-            suffix = '[{}:{}]'.format(ty.low, ty.high)
-            if ty.child in self.type_name_mapping:
-                return self.type_name_mapping[ty.child]+suffix
-            else:
-                return repr(ty)
-        return self.type_name_mapping.get(ty, repr(ty))
+        # Slices are never named themselves, so a single lookup resolves any
+        # named object and only unnamed ones need their kind checked
+        name = self._names.get(ty)
+        if name is not None:
+            return name
+        if ty.KIND == K_SLICE:
+            name = self._names.get(ty.child)
+            if name is not None:
+                return f'{name}[{ty.low}:{ty.high}]'
+        return repr(ty)
+
+    # Render the name of everything in the argument registers and on the
+    # stack. Must be called again if the assignments or names change.
+    def update_strs(self):
+        ton = self.typestr_or_name
+        self.gpr_strs = tuple(ton(ty) for ty in self.gprs)
+        if self.fprs is not None:
+            self.fpr_strs = tuple(ton(ty) for ty in self.fprs)
+        self.stack_strs = tuple(ton(ty) for ty in self.stack)
+
+    # Return the names of argument registers a<lo>..a<hi-1> as a tuple
+    def arg_gprs_str(self, lo=0, hi=8):
+        return self.gpr_strs[lo:hi]
+
+    def arg_fprs_str(self, lo=0, hi=8):
+        if self.fpr_strs is None:
+            raise ValueError('no FPRs without FLEN')
+        return self.fpr_strs[lo:hi]
 
     def get_oldsp_rel_stack_locs(self):
-        locs = []
-        oldsp_off = 0
-        for idx, ty in enumerate(self.stack):
-            if idx == 0:
-                locs.append(0)
-                continue
-            obj = self.stack[idx]
-            prev_obj = self.stack[idx-1]
-            oldsp_off += prev_obj.size
-            oldsp_off = align_to(oldsp_off, self.xlen)
-            oldsp_off = align_to(oldsp_off, obj.alignment)
-            locs.append(oldsp_off//8)
-        return locs
+        return list(self._stack_offsets)
 
     def get_oldsp_rel_stack_loc(self, obj_idx):
         if obj_idx < 0 or obj_idx >= len(self.stack):
             raise ValueError("invalid stack object")
-        obj = self.stack[obj_idx]
-        sp_offset = 0
-        for i in range(0, obj_idx):
-            sp_offset = align_to(sp_offset, max(self.xlen, self.stack[i].alignment))
-            sp_offset += self.stack[i].size
-        sp_offset = align_to(sp_offset, max(self.xlen, obj.alignment))
-        return sp_offset//8
-
-    def __repr__(self):
-        out = []
-        if len(self.type_name_mapping) > 0:
-            out.append('Args:')
-            for item in sorted(self.type_name_mapping.items(), 
-                    key=operator.itemgetter(1)):
-                if item[1][0] == '&':
+        return self._stack_offsets[obj_idx]
+
+    # Describe each stack object and its oldsp-relative offset, one per line
+    def stack_info_lines(self):
+        ton = self.typestr_or_name
+        return [f'{ton(ty)} (oldsp+{off})'
+                for ty, off in zip(self.stack, self._stack_offsets)]
+
+    def _repr_lines(self):
+        if len(self._named) > 0:
+            yield 'Args:'
+            for ty in self._named:
+                name = self._names[ty]
+                if name[0] == '&':
                     continue
-                out.append('{}: {}'.format(item[1], item[0]))
-            out.append('')
-        out.append('GPRs:')
+                yield f'{name}: {ty}'
+            yield ''
+        yield 'GPRs:'
         for i in range(0, 8):
-            out.append('GPR[a{}]: {}'.format(i, 
-                self.typestr_or_name(self.gprs[i+10])))
+            yield f'GPR[a{i}]: {self.typestr_or_name(self.gprs[i])}'
 
         if self.flen:
-            out.append('\nFPRs:')
+            yield '\nFPRs:'
             for i in range(0, 8):
-                out.append('FPR[fa{}]: {}'.format(i,
-                    self.typestr_or_name(self.fprs[i+10])))
+                yield f'FPR[fa{i}]: {self.typestr_or_name(self.fprs[i])}'
+
+        yield '\nStack:'
+        yield from self.stack_info_lines()
 
-        out.append('\nStack:')
-        oldsp_offs = self.get_oldsp_rel_stack_locs()
-        for idx, ty in enumerate(self.stack):
-            out.append('{} (oldsp+{})'.format(self.typestr_or_name(ty),
-                oldsp_offs[idx]))
-        return '\n'.join(out)
+    def __repr__(self):
+        return '\n'.join(self._repr_lines())
+
+# Maximum number of signatures whose assignments each RVMachine remembers
+CALL_CACHE_SIZE = 4096
 
 class InvalidVarArgs(Exception):
     pass
 
+# Register widths (in bits) supported for both XLEN and FLEN
+REG_WIDTHS = frozenset([32, 64, 128])
+
+# Vararg promotion tables, built on first use for each (xlen, flen)
+_vararg_promotion_tables = {}
+
+# Integer varargs narrower than xlen are promoted to xlen, and floating point
+# varargs narrower than xlen to flen. The table is keyed by the key() of the
+# unpromoted type. The keys are built directly rather than through Int() and
+# FP(), so no sub-byte types are interned as a side effect.
+def vararg_promotions(xlen, flen):
+    table = _vararg_promotion_tables.get((xlen, flen))
+    if table is None:
+        table = {}
+        # check_pow2_size permits sizes below 8 bits, so start from 1
+        size = 1
+        while size < xlen:
+            for signed in (True, False):
+                table[(K_INT, size, signed)] = Int(xlen, signed)
+            if flen:
+                table[(K_FP, size)] = FP(flen)
+            size *= 2
+        _vararg_promotion_tables[(xlen, flen)] = table
+    return table
+
 class RVMachine(object):
     def __init__(self, xlen=64, flen=None):
-        if xlen not in [32, 64, 128]:
+        if xlen not in REG_WIDTHS:
             raise ValueError("unsupported XLEN")
-        if flen and flen not in [32, 64, 128]:
+        if flen and flen not in REG_WIDTHS:
             raise ValueError("unsupported FLEN")
         self.xlen = xlen
         self.flen = flen
+        # Frequently used size limits, computed once per machine
+        self._xlen2 = 2*xlen
+        self._flen2 = 2*flen if flen else 0
+        self._max_pair = max(self._xlen2, self._flen2)
+        # The largest member of each kind that fits in a single register
+        self._reg_size = {K_INT: xlen, K_FP: flen}
+        # Register/stack assignments of previous calls, keyed by signature
+        self._call_cache = {}
+        self._vararg_promotions = vararg_promotions(xlen, flen)
 
     def ptr_ty(self):
         return Ptr(self.xlen)
 
+    # Whether a pair of flattened struct members may be passed or returned
+    # according to the floating point calling convention, without regard to
+    # register availability
+    def fp_pair_fits(self, ty1, ty2):
+        k1, k2 = ty1.KIND, ty2.KIND
+        reg_size = self._reg_size
+        return ((k1, k2) in FP_PAIR_KINDS and ty1.size <= reg_size[k1] and
+                ty2.size <= reg_size[k2])
+
     # Should be called after any expected VarArgs has been flattened
     def verify_arg_list(self, in_args, out_arg):
-        # Ensure all argument/return type objects are unique
-        if (len(in_args) != len(set(in_args))) or out_arg in in_args:
-            raise ValueError("Unique type objects must be used")
+        # call() clones every argument and the return type before verifying
+        # them, so the type objects are always unique and need no check here
         if isinstance(out_arg, VarArgs):
             raise InvalidVarArgs("Return type cannot be varargs")
         for arg in in_args:
-            if (isinstance(arg, VarArgs)):
+            if isinstance(arg, VarArgs):
                 raise InvalidVarArgs("VarArgs must be last element")
 
     def ret(self, ty):
@@ -405,18 +799,22 @@ class RVMachine(object):
         state = self.call(in_args)
 
         # Detect the case where the return value would be passed by reference
-        if state.typestr_or_name(state.gprs[10]).startswith('&'):
-            state.gprs[10] = None
+        if state.gpr_strs[0].startswith('&'):
+            state.gprs[0] = None
 
-        newty = next(iter(state.type_name_mapping))
-        state.type_name_mapping[newty] = 'ret'
+        # state.in_args holds the unique copy of ty that call() named
+        if state.in_args:
+            state.set_name(state.in_args[0], 'ret')
+        state.update_strs()
         return state
 
 
     def call(self, in_args, out_arg=None):
         # Remove the VarArgs wrapper type, but keep track of the arguments
         # specified to be vararg. var_args_index will point past the end of
-        # in_args if there are no varargs.
+        # in_args if there are no varargs. in_args may be any iterable and is
+        # copied first, so the caller's sequence is never modified.
+        in_args = list(in_args)
         var_args_index = len(in_args)
         if len(in_args) >= 1 and isinstance(in_args[-1], VarArgs):
             var_args = in_args[-1].args
@@ -425,63 +823,78 @@ class RVMachine(object):
             in_args.extend(var_args)
 
         # Ensure there's a unique object to represent every argument type
-        in_args = [copy.copy(arg) for arg in in_args]
-        out_arg = copy.copy(out_arg)
+        in_args = [arg._clone() for arg in in_args]
+        if out_arg is not None:
+            out_arg = out_arg._clone()
 
         self.verify_arg_list(in_args, out_arg)
 
-        # Filter out empty structs
-        in_args = [arg for arg in in_args if arg.size > 0]
-
-        def isStruct(ty):
-            return isinstance(ty, Struct)
-        def isArray(ty):
-            return isinstance(ty, Array)
-        def isFP(ty):
-            return isinstance(ty, FP)
-        def isInt(ty):
-            return isinstance(ty, Int)
-        def isPad(ty):
-            return isinstance(ty, Pad)
-
         xlen, flen = self.xlen, self.flen
-
-        # Promote varargs
-        for idx in range(var_args_index, len(in_args)):
-            arg = in_args[idx]
-            if isInt(arg) and arg.size < xlen:
-                arg.size = xlen
-                arg.alignment = xlen
-            elif isFP(arg) and arg.size < xlen:
-                arg.size = flen
-                arg.alignment = flen
-
-        state = CCState(xlen, flen, in_args, var_args_index, out_arg)
+        out_kind = out_arg.KIND if out_arg is not None else None
 
         # Error out if Arrays are being passed/returned directly. This isn't 
         # supported in C
-        if isArray(out_arg) or any(isArray(ty) for ty in in_args):
+        if out_kind == K_ARRAY:
             raise ValueError('Byval arrays not supported in C')
 
+        # Filter out empty structs, check for byval arrays and promote varargs
+        # in a single pass. var_args_index is updated to account for any
+        # named arguments that were filtered out.
+        filtered_args = []
+        num_named_args = 0
+        promotions = self._vararg_promotions
+        for idx, arg in enumerate(in_args):
+            if arg.size == 0:
+                continue
+            kind = arg.KIND
+            if kind == K_ARRAY:
+                raise ValueError('Byval arrays not supported in C')
+            if idx < var_args_index:
+                num_named_args += 1
+            elif kind == K_INT or kind == K_FP:
+                promoted = promotions.get(arg.key())
+                if promoted is not None:
+                    arg = promoted._clone()
+            filtered_args.append(arg)
+        in_args = filtered_args
+        var_args_index = num_named_args
+
+        state = CCState(xlen, flen, in_args, var_args_index, out_arg)
+
+        # The assignments only depend on the structure of the signature, so
+        # reuse the result of any previous call with an identical one
+        key = (var_args_index, tuple(arg.key() for arg in in_args),
+               out_arg.key() if out_arg is not None else None)
+        assignments = self._call_cache.get(key)
+        if assignments is not None:
+            state.import_assignments(assignments)
+        else:
+            self.assign_args(state)
+            if len(self._call_cache) >= CALL_CACHE_SIZE:
+                del self._call_cache[next(iter(self._call_cache))]
+            self._call_cache[key] = state.export_assignments()
+        state.update_strs()
+        return state
+
+    # Assign the arguments of state (and the return value address, if it is
+    # returned by reference) to registers and the stack
+    def assign_args(self, state):
+        xlen, flen = self.xlen, self.flen
+        xlen2, flen2 = self._xlen2, self._flen2
+        in_args = state.in_args
+        var_args_index = state.var_args_index
+        out_arg = state.out_arg
+        out_kind = out_arg.KIND if out_arg is not None else None
+
         # Catch the special case of returning a struct that can be returned 
         # according to the floating point calling convention
-        if flen and isStruct(out_arg) and out_arg.size <= 2*flen:
-            ty = Struct(*out_arg.flatten())
-            mems = [mem for mem in ty.members if not isPad(mem)]
-            if len(mems) == 2:
-                ty1, ty2 = mems[0], mems[1]
-                if ((isFP(ty1) and isFP(ty2) and
-                    ty1.size <= flen and ty2.size <= flen) or
-                   (isFP(ty1) and isInt(ty2) and
-                    ty1.size <= flen and ty2.size <= xlen) or
-                   (isInt(ty1) and isFP(ty2) and
-                    ty1.size <= xlen and ty2.size <= flen)):
-                    pass
-                else:
-                    state.pass_by_reference(out_arg)
+        if flen and out_kind == K_STRUCT and out_arg.size <= flen2:
+            _, mems = out_arg.flat_layout()
+            if len(mems) == 2 and not self.fp_pair_fits(*mems):
+                state.pass_by_reference(out_arg)
         # If the return value won't be returned in registers, the address to 
         # store it to is passed as an implicit first parameter
-        elif out_arg and out_arg.size > 2*xlen:
+        elif out_arg and out_arg.size > xlen2:
             state.pass_by_reference(out_arg)
 
         for index, ty in enumerate(in_args):
@@ -493,59 +906,51 @@ class RVMachine(object):
                 # in fprs/gprs (i.e. it is possible it contains two floating 
                 # point values, or one fp + one int)
                 flat_ty = ty
-                if isStruct(ty) and ty.size <= max(2*flen, 2*xlen):
-                    flat_ty = Struct(*ty.flatten())
-                    if len(flat_ty.members) == 1:
-                        flat_ty = flat_ty[0]
-                if isFP(flat_ty) and flat_ty.size <= flen and state.fprs_left >= 1:
+                mems = ()
+                if ty.KIND == K_STRUCT and ty.size <= self._max_pair:
+                    flat_size, mems = ty.flat_layout()
+                    if len(mems) == 1:
+                        # A struct with a single member is passed as that
+                        # member would be
+                        flat_ty = mems[0]
+                    elif flat_size > flen2:
+                        mems = ()
+                if (flat_ty.KIND == K_FP and flat_ty.size <= flen and
+                    state.fprs_left >= 1):
                     state.assign_to_fpr(ty)
                     continue
-                elif isStruct(flat_ty) and flat_ty.size <= 2*flen:
-                    # Ignore any padding
-                    mems = [mem for mem in flat_ty.members if not isPad(mem)]
-                    if len(mems) == 2:
-                        ty1, ty2 = mems[0], mems[1]
-                        ty1_slice = Slice(ty, 0, ty1.size - 1)
+                elif len(mems) == 2 and self.fp_pair_fits(*mems):
+                    ty1, ty2 = mems
+                    # Each member goes in a register of its own kind, and
+                    # registers must be available for both
+                    fprs_needed = (ty1.KIND == K_FP) + (ty2.KIND == K_FP)
+                    if (state.fprs_left >= fprs_needed and
+                        state.gprs_left >= 2 - fprs_needed):
                         ty2_off = max(ty1.size, ty2.alignment)
-                        ty2_slice = Slice(ty, ty2_off,
-                                          ty2_off + ty2.size - 1)
-                        if (isFP(ty1) and isFP(ty2)
-                            and ty1.size <= flen and ty2.size <= flen
-                            and state.fprs_left >= 2):
-                           state.assign_to_fpr(ty1_slice)
-                           state.assign_to_fpr(ty2_slice)
-                           continue
-                        elif (isFP(ty1) and isInt(ty2) and
-                              ty1.size <= flen and ty2.size <= xlen and
-                              state.fprs_left >= 1 and state.gprs_left >= 1):
-                            state.assign_to_fpr(ty1_slice)
-                            state.assign_to_gpr(ty2_slice)
-                            continue
-                        elif (isInt(ty1) and isFP(ty2) and
-                              ty1.size <= xlen and ty2.size <= flen and
-                              state.gprs_left >=1 and state.fprs_left >=1):
-                            state.assign_to_gpr(ty1_slice)
-                            state.assign_to_fpr(ty2_slice)
-                            continue
+                        state.assign_to_reg(ty1.KIND,
+                                            Slice(ty, 0, ty1.size - 1))
+                        state.assign_to_reg(ty2.KIND,
+                                            Slice(ty, ty2_off,
+                                                  ty2_off + ty2.size - 1))
+                        continue
 
             # If we got to here, the standard integer calling convention 
             # applies
             if ty.size <= xlen:
                 state.assign_to_gpr_or_stack(ty)
-            elif ty.size <= 2*xlen:
+            elif ty.size <= xlen2:
                 # 2xlen-aligned varargs must be passed in an aligned register
                 # pair
-                if (is_var_arg and ty.alignment == 2*xlen
+                if (is_var_arg and ty.alignment == xlen2
                     and state.gprs_left % 2 == 1):
                     state.skip_gpr()
                 if state.gprs_left > 0:
                     state.assign_to_gpr_or_stack(Slice(ty, 0, xlen-1))
-                    state.assign_to_gpr_or_stack(Slice(ty, xlen, 2*xlen - 1))
+                    state.assign_to_gpr_or_stack(Slice(ty, xlen, xlen2 - 1))
                 else:
                     state.assign_to_stack(ty)
             else:
                 state.pass_by_reference(ty)
-        return state
 
 if __name__ == '__main__':
     print("""
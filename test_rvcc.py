@@ -1,6 +1,12 @@
+import copy
+import pickle
 import pytest
 from rvcc import *
 
+# Argument lists used to fill the first seven argument registers
+SEVEN_CHARS = (Char,) * 7
+SEVEN_INT8 = (Int8,) * 7
+
 def test_first_class_array_arg():
     with pytest.raises(ValueError):
         RVMachine().call([Array(Int8, 3)])
@@ -25,121 +31,185 @@ def test_invalid_flen():
     with pytest.raises(ValueError):
        RVMachine(flen=256)
 
-def get_arg_gprs(state):
-    return [state.typestr_or_name(state.gprs[idx]) for idx in range(10, 18)]
-
-def get_arg_fprs(state):
-    return [state.typestr_or_name(state.fprs[idx]) for idx in range(10, 18)]
-
-def get_stack_objects(state):
-    return [state.typestr_or_name(obj) for obj in state.stack]
-
-def test_no_args_void_return():
-    m = RVMachine(xlen=32)
-    state = m.call([])
-    assert(get_arg_gprs(state)[0:1] == ["?"])
+def test_invalid_scalar_size():
+    with pytest.raises(ValueError):
+       Int(24)
+    with pytest.raises(ValueError):
+       FP(48)
+    with pytest.raises(ValueError):
+       Ptr(0)
+
+def test_interned_scalars():
+    assert(Int(8, True) is Int8)
+    assert(UInt(32) is UInt32)
+    assert(FP(64) is Double)
+    assert(Ptr(32) is Ptr32)
+    assert(UInt(8) is Char and SInt(16) is Int16)
+    assert(FP(32) is Float and FP(128) is LongDouble)
+    assert(Ptr(64) is Ptr64)
+
+def test_copy_pickle_scalars():
+    # Copies are distinct objects, so modifying one can't affect the interned
+    # instance, while unpickling gives back the interned instance itself
+    for ty in [Int8, UInt32, Double, Ptr32]:
+        for new_ty in [copy.copy(ty), copy.deepcopy(ty)]:
+            assert(new_ty is not ty)
+            assert(new_ty.key() == ty.key())
+        assert(pickle.loads(pickle.dumps(ty)) is ty)
+    ty = copy.copy(Int8)
+    ty.size = 32
+    assert(Int8.size == 8)
+    # ...and an unpickled clone is a clone, not the interned instance
+    for ty in [Int8, Double, Ptr32]:
+        new_ty = pickle.loads(pickle.dumps(ty._clone()))
+        assert(new_ty is not ty and new_ty.key() == ty.key())
+
+def test_copy_pickle_padded_struct():
+    strct_ty = Struct(Int8, Int32)
+    for new_ty in [copy.deepcopy(strct_ty),
+                   pickle.loads(pickle.dumps(strct_ty))]:
+        assert([ty.key() for ty in new_ty.members] ==
+               [Int8.key(), Pad(24).key(), Int32.key()])
+        assert(new_ty.members[1] is Pad(24))
+        assert((new_ty.size, new_ty.alignment) == (64, 32))
+
+def test_struct_layout():
+    # Padding counts towards the size of a struct
+    strct_ty = Struct(Int8, Int32, Int8)
+    assert(strct_ty.members == (Int8, Pad(24), Int32, Int8))
+    assert((strct_ty.size, strct_ty.alignment) == (96, 32))
+    assert((Struct(Int8, Int8, Int32).size, Struct(Double, Int8).size) ==
+           (64, 128))
+
+# These machines are deliberately shared between tests. RVMachine.call()
+# returns a fresh CCState each time; the only thing that changes is the
+# machine's signature cache, so a test may take either the fresh or the
+# cached assignment path depending on which tests ran before it
+@pytest.fixture(scope="module")
+def rv32():
+    return RVMachine(xlen=32)
+
+@pytest.fixture(scope="module")
+def rv32ifd():
+    return RVMachine(xlen=32, flen=64)
+
+# Compare the leading argument registers and the full list of stack objects
+# in one assertion, so that a failure reports all of them together
+def assert_layout(state, gprs=None, fprs=None, stack=None):
+    expected = {}
+    actual = {}
+    if gprs is not None:
+        expected['gprs'] = gprs
+        actual['gprs'] = state.arg_gprs_str(0, len(gprs))
+    if fprs is not None:
+        expected['fprs'] = fprs
+        actual['fprs'] = state.arg_fprs_str(0, len(fprs))
+    if stack is not None:
+        expected['stack'] = stack
+        actual['stack'] = state.stack_strs
+    assert(actual == expected)
+
+def test_no_args_void_return(rv32):
+    state = rv32.call([])
+    assert_layout(state, gprs=("?",))
+    with pytest.raises(ValueError):
+        state.arg_fprs_str()
 
-def test_many_args():
+def test_many_args(rv32):
     # The stack should be used when arg registers are exhausted
-    m = RVMachine(xlen=32)
-    state = m.call([UInt8, Char, Char, Char, Char, Char, Char,
-        Int8, Int8, Int8, UInt128])
-    assert(get_stack_objects(state) == ["arg08", "arg09", "&arg10"])
+    state = rv32.call([*SEVEN_CHARS, Int8, Int8, Int8, UInt128])
+    assert_layout(state, stack=("arg08", "arg09", "&arg10"))
     assert(state.get_oldsp_rel_stack_locs() == [0, 4, 8])
 
-def test_2xlen_rv32i():
+def test_2xlen_rv32i(rv32):
     # 2xlen arguments are passed in GPRs, which need not be 'aligned' register 
     # pairs
-    m = RVMachine(xlen=32)
-    state = m.call([Int64, Int32, Double, Struct(Int8, Int32, Int8)])
-    assert(get_arg_gprs(state)[0:8] == ["arg00[0:31]", "arg00[32:63]", 
-        "arg01", "arg02[0:31]", "arg02[32:63]", "arg03[0:31]", "arg03[32:63]", "?"])
+    state = rv32.call([Int64, Int32, Double, Struct(Int8, Int8, Int32)])
+    assert_layout(state, gprs=("arg00[0:31]", "arg00[32:63]", "arg01",
+        "arg02[0:31]", "arg02[32:63]", "arg03[0:31]", "arg03[32:63]", "?"))
 
     # If only one arg GPR is available, the other half goes on the stack
-    state = m.call([Int8, Int8, Int8, Int8, Int8, Int8, Int8,
-        Double])
-    assert(get_arg_gprs(state)[6:8] == ["arg06", "arg07[0:31]"])
-    assert(len(state.stack) == 1)
-    assert(state.typestr_or_name(state.stack[0]) == "arg07[32:63]")
+    state = rv32.call([*SEVEN_INT8, Double])
+    assert(state.arg_gprs_str(6, 8) == ("arg06", "arg07[0:31]"))
+    assert_layout(state, stack=("arg07[32:63]",))
 
     # 2xlen arguments must have their alignment maintained when passed on the
     # stack
-    state = m.call([Int8, Int8, Int8, Int8, Int8, Int8, Int8,
-        Int8, Int8, Double])
-    assert(get_stack_objects(state) == ["arg08", "arg09"])
+    state = rv32.call([*SEVEN_INT8, Int8, Int8, Double])
+    assert_layout(state, stack=("arg08", "arg09"))
     assert(state.get_oldsp_rel_stack_locs() == [0, 8])
 
-def test_gt_2xlen_rv32i():
+def test_gt_2xlen_rv32i(rv32):
     # scalars and aggregates > 2xlen are passed indirect
-    m = RVMachine(xlen=32)
-    state = m.call([Int128, LongDouble, Struct(Int64, Double)])
-    assert(get_arg_gprs(state)[0:4] == ["&arg00", "&arg01", "&arg02", "?"])
+    state = rv32.call([Int128, LongDouble, Struct(Int64, Double)])
+    assert_layout(state, gprs=("&arg00", "&arg01", "&arg02", "?"))
 
-def test_fp_scalars_rv32ifd():
-    m = RVMachine(xlen=32, flen=64)
+def test_fp_scalars_rv32ifd(rv32ifd):
     # FPRs should be used as well as GPRs
-    state = m.call([Float, Int64, Double, Int32])
-    assert(get_arg_gprs(state)[0:4] == ["arg01[0:31]", "arg01[32:63]", 
-        "arg03", "?"])
-    assert(get_arg_fprs(state)[0:3] == ["arg00", "arg02", "?"])
+    state = rv32ifd.call([Float, Int64, Double, Int32])
+    assert_layout(state, gprs=("arg01[0:31]", "arg01[32:63]", "arg03", "?"),
+        fprs=("arg00", "arg02", "?"))
 
     # Use GPRs when FPR arg registers are exhausted
-    state = m.call([Float, Double, Float, Double, Float, Double, Float,
+    state = rv32ifd.call([Float, Double, Float, Double, Float, Double, Float,
         Double, Char, Double, Float])
-    assert(get_arg_gprs(state)[0:5] == ["arg08", "arg09[0:31]", 
-        "arg09[32:63]", "arg10", "?"])
+    assert_layout(state,
+        gprs=("arg08", "arg09[0:31]", "arg09[32:63]", "arg10", "?"))
 
     # A float might end up split between stack and GPRs due to the FPRs being 
     # exhausted
-    state = m.call([Float, Int64, Double, Int64, Float, Int64, Double, Char,
+    state = rv32ifd.call([Float, Int64, Double, Int64, Float, Int64, Double, Char,
         Float, Double, Float, Double, Double])
-    assert(get_arg_gprs(state)[6:8] == ["arg07", "arg12[0:31]"])
-    assert(get_stack_objects(state) == ["arg12[32:63]"])
+    assert(state.arg_gprs_str(6, 8) == ("arg07", "arg12[0:31]"))
+    assert_layout(state, stack=("arg12[32:63]",))
 
     # Greater than flen, pass according to integer calling convention
-    state = m.call([LongDouble])
-    assert(get_arg_gprs(state)[0:2] == ["&arg00", "?"])
+    state = rv32ifd.call([LongDouble])
+    assert_layout(state, gprs=("&arg00", "?"))
 
-def test_fp_int_aggregates_rv32ifd():
-    m = RVMachine(xlen=32, flen=64)
+def test_fp_int_aggregates_rv32ifd(rv32ifd):
     # Float+float
-    state = m.call([Struct(Double, Float)])
-    assert(get_arg_fprs(state)[0:3] == ["arg00[0:63]", "arg00[64:95]", "?"])
+    state = rv32ifd.call([Struct(Double, Float)])
+    assert_layout(state, fprs=("arg00[0:63]", "arg00[64:95]", "?"))
 
     # Float+int, int+float
-    state = m.call([Struct(Double, Int16)])
-    assert(get_arg_gprs(state)[0:2] == ["arg00[64:79]", "?"])
-    assert(get_arg_fprs(state)[0:2] == ["arg00[0:63]", "?"])
-    state = m.call([Struct(Int8, Double)])
-    assert(get_arg_gprs(state)[0:2] == ["arg00[0:7]", "?"])
-    assert(get_arg_fprs(state)[0:2] == ["arg00[64:127]", "?"])
+    state = rv32ifd.call([Struct(Double, Int16)])
+    assert_layout(state, gprs=("arg00[64:79]", "?"), fprs=("arg00[0:63]", "?"))
+    state = rv32ifd.call([Struct(Int8, Double)])
+    assert_layout(state, gprs=("arg00[0:7]", "?"), fprs=("arg00[64:127]", "?"))
+
+    # A struct containing a single float is passed as a float
+    state = rv32ifd.call([Struct(Float), Struct(Array(Double, 1))])
+    assert_layout(state, gprs=("?",), fprs=("arg00", "arg01", "?"))
 
     # The "int" field can't be a small aggregate
-    state = m.call([Struct(Struct(Int8, Int8), Float)])
-    assert(get_arg_gprs(state)[0:3] == ["arg00[0:31]", "arg00[32:63]", "?"])
-    assert(get_arg_fprs(state)[0] == "?")
+    state = rv32ifd.call([Struct(Struct(Int8, Int8), Float)])
+    assert_layout(state, gprs=("arg00[0:31]", "arg00[32:63]", "?"),
+        fprs=("?",))
 
     # Use integer calling convention if the int is greater than xlen or the 
     # float greater than flen
-    state = m.call([Struct(Int64, Float)])
-    assert(get_arg_gprs(state)[0:2] == ["&arg00", "?"])
-    assert(get_arg_fprs(state)[0] == "?")
-    state = m.call([Struct(Int32, LongDouble)])
-    assert(get_arg_gprs(state)[0:2] == ["&arg00", "?"])
-    assert(get_arg_fprs(state)[0] == "?")
-
-    # Check flattening
-    equiv_args = [
-        [Struct(Int32, Struct(Double))],
-        [Struct(Array(Int32, 1), Struct(Double))],
-        [Struct(Array(Int32, 1), Array(Struct(Double), 1))],
-        [Struct(Struct(Int32), Struct(), Struct(Double))],
-        [Struct(Int32, Struct(Array(Double, 1)))],
-        ]
-    for args in equiv_args:
-        state = m.call(args)
-        assert(get_arg_gprs(state)[0:2] == ["arg00[0:31]", "?"])
-        assert(get_arg_fprs(state)[0:2] == ["arg00[64:127]", "?"])
+    state = rv32ifd.call([Struct(Int64, Float)])
+    assert_layout(state, gprs=("&arg00", "?"), fprs=("?",))
+    state = rv32ifd.call([Struct(Int32, LongDouble)])
+    assert_layout(state, gprs=("&arg00", "?"), fprs=("?",))
+
+# Check flattening: all of these are equivalent to Struct(Int32, Double)
+equiv_args = [
+    [Struct(Int32, Struct(Double))],
+    [Struct(Array(Int32, 1), Struct(Double))],
+    [Struct(Array(Int32, 1), Array(Struct(Double), 1))],
+    [Struct(Struct(Int32), Struct(), Struct(Double))],
+    [Struct(Int32, Struct(Array(Double, 1)))],
+    ]
+
+@pytest.mark.parametrize("args", equiv_args, ids=["struct_double",
+    "array1_struct_double", "array1_array1", "nested_empty",
+    "array1_inside_struct"])
+def test_fp_int_aggregates_flattening(rv32ifd, args):
+    state = rv32ifd.call(args)
+    assert_layout(state, gprs=("arg00[0:31]", "?"),
+        fprs=("arg00[64:127]", "?"))
 
 def test_var_args_wrapper():
     # Test that VarArgs can't be misused
@@ -151,39 +221,51 @@ def test_var_args_wrapper():
     with pytest.raises(InvalidVarArgs):
         RVMachine().call([VarArgs(Int32), Int64])
 
-def test_var_args():
-    m = RVMachine(xlen=32, flen=64)
+def test_var_args(rv32ifd):
 
-    state = m.call([Int32, VarArgs(Int32, Struct(Int64, Double))])
-    assert(get_arg_gprs(state)[0:4] == ["arg00", "varg00", "&varg01", "?"])
+    state = rv32ifd.call([Int32, VarArgs(Int32, Struct(Int64, Double))])
+    assert_layout(state, gprs=("arg00", "varg00", "&varg01", "?"))
 
     # 2xlen aligned and sized varargs are passed in an aligned register pair
-    state = m.call([Int32, VarArgs(Int64)])
-    assert(get_arg_gprs(state)[0:4] == ["arg00", "?", "varg00[0:31]", "varg00[32:63]"])
-    state = m.call([Int32, Int32, Int32, Int32, Int32, Int32, Int32, VarArgs(Int64)])
-    assert(get_arg_gprs(state)[6:8] == ["arg06", "?"])
-    assert(get_stack_objects(state) == ["varg00"])
+    args = [Int32, VarArgs(Int64)]
+    state = rv32ifd.call(args)
+    assert_layout(state, gprs=("arg00", "?", "varg00[0:31]", "varg00[32:63]"))
+    # The caller's argument list is left untouched
+    assert(len(args) == 2 and isinstance(args[1], VarArgs))
+    state = rv32ifd.call([Int32, Int32, Int32, Int32, Int32, Int32, Int32, VarArgs(Int64)])
+    assert(state.arg_gprs_str(6, 8) == ("arg06", "?"))
+    assert_layout(state, stack=("varg00",))
 
     # a 2xlen argument with alignment less than 2xlen isn't passed in an
     # aligned register pair
-    state = m.call([VarArgs(Int32, Struct(Ptr32, Int32))])
-    assert(get_arg_gprs(state)[0:4] == ["varg00", "varg01[0:31]", "varg01[32:63]", "?"])
+    state = rv32ifd.call([VarArgs(Int32, Struct(Ptr32, Int32))])
+    assert_layout(state, gprs=("varg00", "varg01[0:31]", "varg01[32:63]", "?"))
 
     # Floating point varargs are always passed according to the integer
     # calling convention
-    state = m.call([Float, VarArgs(Double, Struct(Int32, Float))])
-    assert(get_arg_gprs(state)[0:5] == ["varg00[0:31]", "varg00[32:63]",
-        "varg01[0:31]", "varg01[32:63]", "?"])
-    assert(get_arg_fprs(state)[0:2] == ["arg00", "?"])
+    state = rv32ifd.call([Float, VarArgs(Double, Struct(Int32, Float))])
+    assert_layout(state, gprs=("varg00[0:31]", "varg00[32:63]", "varg01[0:31]",
+        "varg01[32:63]", "?"), fprs=("arg00", "?"))
 
-    # Varargs should be promoted
-    state = m.call([VarArgs(Float, Int8, UInt16)])
-    assert([str(state.gprs[10]), str(state.gprs[11]), str(state.gprs[12])] ==
-            ["FP32", "SInt32", "UInt32"])
+    # Empty named arguments are ignored when numbering varargs
+    state = rv32ifd.call([Struct(), VarArgs(Int32)])
+    assert_layout(state, gprs=("varg00", "?"))
 
-def test_simple_usage():
-    m = RVMachine(xlen=32, flen=64)
-    state = m.call([
+    # Varargs should be promoted
+    state = rv32ifd.call([VarArgs(Float, Int8, UInt16)])
+    assert([ty.key() for ty in state.gprs[0:3]] ==
+            [Float.key(), Int32.key(), UInt32.key()])
+    # ...without modifying the shared scalar types
+    assert(Int8.size == 8 and UInt16.size == 16)
+    # ...including types narrower than a byte
+    state = rv32ifd.call([VarArgs(Int(4), UInt(1))])
+    assert([ty.key() for ty in state.gprs[0:2]] == [Int32.key(), UInt32.key()])
+    # ...and floats are left alone if there is no FLEN to promote them to
+    state = RVMachine(xlen=64).call([VarArgs(Float)])
+    assert(state.gprs[0].key() == Float.key())
+
+def test_simple_usage(rv32ifd):
+    state = rv32ifd.call([
         Int32,
         Double,
         Struct(Int8, Array(Float, 1)),
@@ -191,62 +273,93 @@ def test_simple_usage():
         Int64,
         Int64,
         Int64])
-    assert(get_arg_gprs(state) == ["arg00", "arg02[0:7]", "&arg03", "arg04[0:31]", 
-        "arg04[32:63]", "arg05[0:31]", "arg05[32:63]", "arg06[0:31]"])
-    assert(get_arg_fprs(state)[0:3] == ["arg01", "arg02[32:63]", "?"])
-    assert(len(state.stack) == 1)
-    assert(state.typestr_or_name(state.stack[0]) == "arg06[32:63]")
+    assert_layout(state, gprs=("arg00", "arg02[0:7]", "&arg03", "arg04[0:31]",
+        "arg04[32:63]", "arg05[0:31]", "arg05[32:63]", "arg06[0:31]"),
+        fprs=("arg01", "arg02[32:63]", "?"), stack=("arg06[32:63]",))
 
-def test_large_return():
-    m = RVMachine(xlen=32)
-    state = m.call([], Int128)
-    assert(get_arg_gprs(state)[0:2] == ["&ret", "?"])
-    state = m.call([], Int32)
-    assert(get_arg_gprs(state)[0] == "?")
+def test_large_return(rv32):
+    state = rv32.call([], Int128)
+    assert_layout(state, gprs=("&ret", "?"))
+    state = rv32.call([], Int32)
+    assert_layout(state, gprs=("?",))
 
-def test_ret_calculations():
-    m = RVMachine(xlen=32, flen=64)
-    state = m.ret(Int32)
-    assert(get_arg_gprs(state)[0:2] == ["ret", "?"])
+def test_ret_calculations(rv32ifd):
+    state = rv32ifd.ret(Int32)
+    assert_layout(state, gprs=("ret", "?"))
 
-    state = m.ret(Int128)
-    assert(get_arg_gprs(state)[0:2] == ["?", "?"])
-    assert(len(state.stack) == 0)
+    state = rv32ifd.ret(Int128)
+    assert_layout(state, gprs=("?", "?"), stack=())
 
-    state = m.ret(Struct(Int32, Double))
-    assert(get_arg_gprs(state)[0:2] == ["ret[0:31]", "?"])
-    assert(get_arg_fprs(state)[0:2] == ["ret[64:127]", "?"])
+    state = rv32ifd.ret(Struct(Int32, Double))
+    assert_layout(state, gprs=("ret[0:31]", "?"), fprs=("ret[64:127]", "?"))
 
-def test_stack_info():
-    m = RVMachine(xlen=32)
-    state = m.call([Int32]*7 + [Double, Int64, Float, Struct(Int64, Int64)])
-    assert(str(state).splitlines()[-4:] == ["arg07[32:63] (oldsp+0)",
+def test_stack_info(rv32):
+    state = rv32.call([Int32]*7 + [Double, Int64, Float, Struct(Int64, Int64)])
+    assert(state.stack_info_lines() == ["arg07[32:63] (oldsp+0)",
             "arg08 (oldsp+8)", "arg09 (oldsp+16)", "&arg10 (oldsp+20)"])
 
-def test_random_int():
-    random.seed(14)
-    assert(Int(8, True).random_literal() == '-74')
-    assert(Int(8, False).random_literal() == '63u')
-    assert(Int(32, True).random_literal() == '-1048936187')
-    assert(Int(64, False).random_literal() == '1339710923952836751ull')
-
-def test_random_fp():
-    random.seed(20)
-    assert(Float.random_literal() == '854.2f')
-    assert(Double.random_literal() == '-468.1')
-    assert(LongDouble.random_literal() == '786.5l')
-
-def test_random_ptr():
-    random.seed(30)
-    assert(Ptr32.random_literal() == '(char*)0x4a08c720u')
-    assert(Ptr64.random_literal() == '(char*)0x7b07fa39c6ab710ull')
-
-def test_random_struct():
-    random.seed(40)
-    strct_ty = Struct(Int32, Ptr32, Float)
-    strct_ty.name = 'foo'
-    assert(strct_ty.random_literal() ==
-           '(struct foo){-2010704054, (char*)0x484d1466u, 361.3f}')
+def test_stack_locs(rv32):
+    # The per-object and whole-stack queries must agree, including for the
+    # first object
+    state = rv32.call([Int32]*8 + [Double, Int8, Int64, Float])
+    locs = state.get_oldsp_rel_stack_locs()
+    assert(locs == [0, 8, 16, 24])
+    assert([state.get_oldsp_rel_stack_loc(i) for i in range(len(locs))] ==
+            locs)
+    with pytest.raises(ValueError):
+        state.get_oldsp_rel_stack_loc(len(locs))
+
+def test_repeated_signature():
+    # A structurally identical signature reuses the earlier assignments, but
+    # they must refer to the new argument objects
+    m = RVMachine(xlen=32, flen=64)
+    args = (Struct(Double, Int32), Int128, Int64, Int8, Int8, Int8, Int8,
+            Struct(Float, Float), Double)
+    state1 = m.call(args, Struct(Int64, Int64))
+    state2 = m.call(args, Struct(Int64, Int64))
+    assert(str(state1) == str(state2))
+    assert(state2.gprs[1].child is state2.in_args[0])
+    assert(state2.fprs[0].child is state2.in_args[0])
+    assert([ty for _, ty in state2.refs] == [state2.out_arg, state2.in_args[1]])
+
+def test_copy_pickle_state():
+    # Names must survive copying and pickling the state
+    state = RVMachine(xlen=32).call([Int32, Int32, Int128])
+    for new_state in [copy.deepcopy(state),
+                      pickle.loads(pickle.dumps(state))]:
+        assert(str(new_state) == str(state))
+        assert(tuple(map(new_state.typestr_or_name, new_state.gprs[0:3])) ==
+               new_state.arg_gprs_str(0, 3) == ("arg00", "arg01", "&arg02"))
+
+def test_slice_arg():
+    # A Slice passed as an argument is assigned (and cached) as a whole
+    m = RVMachine(xlen=32)
+    for _ in range(2):
+        state = m.call([Slice(Int64, 0, 31)])
+        assert_layout(state, gprs=("arg00", "?"))
+        assert(state.gprs[0] is state.in_args[0])
+
+def named_struct(name, *members):
+    ty = Struct(*members)
+    ty.name = name
+    return ty
+
+# Each group of literals is drawn in order from one generator, so the
+# expected values depend on both the seed and the preceding types
+random_literal_goldens = [
+    (14, [Int(8, True), Int(8, False), Int(32, True), Int(64, False)],
+        ['-74', '63u', '-1048936187', '1339710923952836751ull']),
+    (20, [Float, Double, LongDouble], ['854.2f', '-468.1', '786.5l']),
+    (30, [Ptr32, Ptr64], ['(char*)0x4a08c720u', '(char*)0x7b07fa39c6ab710ull']),
+    (40, [named_struct('foo', Int32, Ptr32, Float)],
+        ['(struct foo){-2010704054, (char*)0x484d1466u, 361.3f}']),
+    ]
+
+@pytest.mark.parametrize("seed,tys,expected", random_literal_goldens,
+    ids=["int", "fp", "ptr", "struct"])
+def test_random_literals(seed, tys, expected):
+    rng = random.Random(seed)
+    assert([ty.random_literal(rng) for ty in tys] == expected)
 
 def test_c_types():
     assert(Int8.ctype() == 'int8_t')